@@ -1,38 +1,146 @@
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 import ast
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import itertools
 import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from .report import CoverageReport
 from .line import CoveragePyAnalyzer
 
+# Set to keep the block cache in another directory than the user's cache
+_CACHE_DIR_ENV = "COVERAGEANALYZER_CACHE_DIR"
+
+# Set to disable the block cache
+_NO_CACHE_ENV = "COVERAGEANALYZER_NO_CACHE"
+
+# Subdirectory of the block cache, renamed whenever the pickled layout changes
+_BLOCK_CACHE_VERSION = "blocks-v5"
+
+# Block cache keys include the interpreter, whose parser decides what blocks
+# a source has (e.g. Python 3.14 accepts "except A, B:"); the cache is shared
+_CACHE_KEY_TAG = f"{sys.implementation.cache_tag or sys.version}\0".encode()
+
+# Block cache entries unused for this many seconds are pruned
+_BLOCK_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Below this many files, parsing serially is faster than starting workers
+_PARALLEL_MIN_FILES = 16
+
+# Below this many files, a directory index costs more I/O than it saves
+_INDEX_MIN_FILES = 16
+
+# Directories that never contain Python sources
+_SKIPPED_DIRS = frozenset({"__pycache__", ".git", ".hg", ".svn"})
+
+# Keywords that code blocks start with ("async" blocks also contain one)
+_BLOCK_KEYWORDS = (b"def", b"class", b"if", b"for", b"while", b"try", b"with")
+
+# Node types that form code blocks: (block type, whether it may have an else)
+_BLOCK_NODE_TYPES = {
+    ast.FunctionDef: ("Function", False),
+    ast.ClassDef: ("Class", False),
+    ast.If: ("If", True),
+    ast.For: ("For", True),
+    ast.While: ("While", True),
+    ast.Try: ("Try", True),
+    ast.With: ("With", False),
+    ast.AsyncFunctionDef: ("Async Function", False),
+    ast.AsyncFor: ("Async For", True),
+    ast.AsyncWith: ("Async With", False),
+}
+
+# Code blocks by file path, with the (mtime_ns, size) they were extracted at.
+# Files that failed to parse have None instead of blocks.
+_BLOCKS_BY_FILE: Dict[str, Tuple[int, int, Optional[List["Block"]]]] = {}
+
 
 class Block:
     """Represents a code block in a Python file, such as a function or class.
 
+    Blocks are immutable; equality and hashing consider the file path, line
+    range and type only. The hash is computed once, at construction.
+
     Attributes:
         file_path (str): Path to the file containing the block.
         start_line (int): Starting line number of the block.
         end_line (int): Ending line number of the block.
         type (str): Type of the block (e.g., "Function", "Class").
-        code (str): Source code within the block.
+        code (str): Source code of the block. If not given, it is derived
+            from `source_lines` when first accessed: blocks with a `segment`
+            are rendered like `ast.unparse` renders their node, others are
+            the source lines from `start_line` to `end_line`.
     """
 
+    __slots__ = (
+        "file_path",
+        "start_line",
+        "end_line",
+        "type",
+        "_code",
+        "_source_lines",
+        "_segment",
+        "_hash",
+    )
+
     def __init__(
-        self, file_path: str, start_line: int, end_line: int, block_type: str, code: str
+        self,
+        file_path: str,
+        start_line: int,
+        end_line: int,
+        block_type: str,
+        code: Optional[str] = None,
+        source_lines: Optional[List[str]] = None,
+        segment: Optional[Tuple[int, int, int, int]] = None,
     ):
-        self.file_path = file_path
-        self.start_line = start_line
-        self.end_line = end_line
-        self.type = block_type
-        self.code = code
+        # Attributes of immutable blocks can only be set through object
+        object.__setattr__(self, "file_path", file_path)
+        object.__setattr__(self, "start_line", start_line)
+        object.__setattr__(self, "end_line", end_line)
+        # Types come from a small set; share one string per type, including
+        # for blocks unpickled from the block cache
+        block_type = sys.intern(block_type)
+        object.__setattr__(self, "type", block_type)
+        object.__setattr__(self, "_code", code)
+        object.__setattr__(self, "_source_lines", source_lines)
+        object.__setattr__(self, "_segment", segment)
+        object.__setattr__(
+            self, "_hash", hash((file_path, start_line, end_line, block_type))
+        )
+
+    @property
+    def code(self) -> str:
+        """Source code of the block, extracted on first access."""
+        if self._code is None:
+            lines = self._source_lines or []
+            if self._segment is not None:
+                code = _unparse_segment(lines, self._segment)
+            else:
+                code = "\n".join(lines[self.start_line - 1 : self.end_line])
+            object.__setattr__(self, "_code", code)
+        return self._code
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"cannot assign to '{name}' of an immutable Block")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"cannot delete '{name}' of an immutable Block")
 
     def __repr__(self):
         return f"Block(type={self.type}, lines={self.start_line}-{self.end_line})"
 
     def __eq__(self, other):
         if not isinstance(other, Block):
-            return False
+            return NotImplemented
         return (
             self.file_path == other.file_path
             and self.start_line == other.start_line
@@ -41,7 +149,59 @@ class Block:
         )
 
     def __hash__(self):
-        return hash((self.file_path, self.start_line, self.end_line, self.type))
+        return self._hash
+
+    def __reduce__(self):
+        # String hashes differ between processes, so recompute the hash when
+        # unpickling (from the block cache or a worker) instead of restoring it
+        return (
+            Block,
+            (
+                self.file_path,
+                self.start_line,
+                self.end_line,
+                self.type,
+                self._code,
+                self._source_lines,
+                self._segment,
+            ),
+        )
+
+
+def _unparse_segment(lines: List[str], segment: Tuple[int, int, int, int]) -> str:
+    """Renders a statement's source like `ast.unparse` renders its node.
+
+    The statement is cut from the source lines and parsed on its own, so
+    that its node does not need to be kept around until its code is needed.
+
+    Args:
+        lines (List[str]): The source lines of the file.
+        segment (Tuple[int, int, int, int]): Start line, start column, end line
+            and end column of the statement, as in its node. Columns are UTF-8
+            byte offsets.
+
+    Returns:
+        str: The unparsed statement.
+    """
+    start_line, col, end_line, end_col = segment
+    text = lines[start_line - 1 : end_line]
+    if not text:
+        return ""
+    text[-1] = text[-1].encode()[:end_col].decode(errors="replace")
+    first = text[0][col:]
+    if first.startswith("elif"):
+        first = first[2:]  # An elif is an If node of its own
+    text[0] = text[0][:col] + first
+    source = "\n".join(text)
+    try:
+        # Indented statements are nested, keeping their indentation valid
+        if col:
+            statement = ast.parse("if 1:\n" + source).body[0].body[0]
+        else:
+            statement = ast.parse(source).body[0]
+    except SyntaxError:
+        return source
+    return ast.unparse(statement)
 
 
 class BlockCoverageReport(CoverageReport):
@@ -60,26 +220,42 @@ class BlockCoverageReport(CoverageReport):
         super().__init__()
         self.coverage_data = coverage_data
         self.total_executable_blocks = total_executable_blocks
+        # Reports do not change after construction, so results are memoized
+        self._covered_cache: Dict[str, Set[Block]] = {}
+        self._total_cov: Optional[float] = None
 
     def _get_covered_blocks(self, file: str) -> Set["Block"]:
         """Identifies blocks in a file that have been executed.
 
+        A block is covered if any executed line falls into its body. Executed
+        lines are laid out densely by line number, and their running count
+        turns each block's check into the difference of two entries.
+
         Args:
             file (str): Path to the file to analyze.
 
         Returns:
             Set[Block]: Executed blocks within the file.
         """
-        covered_lines = self.coverage_data.get(file, set())
-        covered_blocks = set()
-
-        for block in self.total_executable_blocks.get(file, []):
-            if any(
-                line in covered_lines
-                for line in range(block.start_line + 1, block.end_line + 1)
-            ):
-                covered_blocks.add(block)
-
+        if file in self._covered_cache:
+            return self._covered_cache[file]
+
+        blocks = self.total_executable_blocks.get(file, [])
+        last_line = max((block.end_line for block in blocks), default=0)
+        executed = bytearray(last_line + 1)
+        for line in self.coverage_data.get(file, ()):
+            if line <= last_line:
+                executed[line] = 1
+        # executed_up_to[n] is the number of executed lines in 1..n
+        executed_up_to = list(itertools.accumulate(executed))
+
+        covered_blocks = {
+            block
+            for block in blocks
+            if executed_up_to[block.end_line] - executed_up_to[block.start_line]
+        }
+
+        self._covered_cache[file] = covered_blocks
         return covered_blocks
 
     def get_file_coverage(self, file: str) -> float:
@@ -101,13 +277,13 @@ class BlockCoverageReport(CoverageReport):
         Returns:
             float: Total block coverage percentage across the project.
         """
-        total_blocks = sum(
-            len(blocks) for blocks in self.total_executable_blocks.values()
-        )
-        covered_blocks = sum(
-            len(self._get_covered_blocks(file)) for file in self.total_executable_blocks
-        )
-        return covered_blocks / total_blocks if total_blocks > 0 else 0.0
+        if self._total_cov is None:
+            total_blocks = sum(map(len, self.total_executable_blocks.values()))
+            covered_blocks = sum(
+                map(len, map(self._get_covered_blocks, self.total_executable_blocks))
+            )
+            self._total_cov = covered_blocks / total_blocks if total_blocks > 0 else 0.0
+        return self._total_cov
 
     def is_block_covered(self, block: Block) -> bool:
         """Checks if a specific block has been covered.
@@ -138,9 +314,12 @@ class BlockCoveragePyAnalyzer(CoveragePyAnalyzer):
     """
 
     def __init__(
-        self, project_root: os.PathLike, harness: Optional[os.PathLike] = None
+        self,
+        project_root: os.PathLike,
+        harness: Optional[os.PathLike] = None,
+        isolated: bool = False,
     ):
-        super().__init__(project_root, harness)
+        super().__init__(project_root, harness, isolated=isolated)
         self.file_blocks: Dict[str, List[Block]] = {}
         self.collect_code_blocks_for_directory(Path(project_root))
 
@@ -169,76 +348,240 @@ class BlockCoveragePyAnalyzer(CoveragePyAnalyzer):
         coverage_report = super().append_coverage(test)
         return BlockCoverageReport(coverage_report.coverage_data, self.file_blocks)
 
+    def append_coverage_batch(self, tests: List[str]) -> List[BlockCoverageReport]:
+        """Appends coverage data for several tests, one after the other.
+
+        Args:
+            tests: The test scripts or commands to run.
+
+        Returns:
+            List[BlockCoverageReport]: One report per test, each including the
+            block coverage of all tests up to and including it.
+        """
+        return [self.append_coverage(test) for test in tests]
+
     def collect_code_blocks_for_directory(self, directory: Path):
         """Collects code blocks from Python files in a directory.
 
         Args:
             directory (Path): Directory to analyze.
         """
-        for file in directory.rglob("*.py"):
-            self.file_blocks[str(file)] = self.get_code_blocks(file)
+        files = list(_iter_python_files(str(directory)))
+        # Files extracted before, by any analyzer, are not loaded again
+        signatures = {}
+        for file in files:
+            stat = os.stat(file)
+            signatures[file] = (stat.st_mtime_ns, stat.st_size)
+        missing = [
+            file
+            for file in files
+            if _BLOCKS_BY_FILE.get(file, (None, None))[:2] != signatures[file]
+        ]
+        if not missing or len(files) < _INDEX_MIN_FILES:
+            # Small trees are loaded file by file, without a directory index
+            for file in missing:
+                _BLOCKS_BY_FILE[file] = (*signatures[file], _load_code_blocks(file))
+            self._store_file_blocks(files)
+            return
+
+        # Next, try the directory's block index left by an earlier process
+        index_name = f"index-{_cache_key(os.path.abspath(directory).encode())}.pkl"
+        index = _read_cache_file(index_name) or {}
+        for file in missing:
+            if index.get(file, (None, None))[:2] == signatures[file]:
+                _BLOCKS_BY_FILE[file] = index[file]
+        missing = [
+            file
+            for file in missing
+            if _BLOCKS_BY_FILE.get(file, (None, None))[:2] != signatures[file]
+        ]
+
+        if len(missing) < _PARALLEL_MIN_FILES:
+            results = map(_load_code_blocks, missing)
+        else:
+            # Parsing is CPU bound, spread it over all cores. Around four
+            # chunks per worker amortize IPC while keeping the load balanced.
+            workers = os.cpu_count() or 1
+            chunksize = max(1, len(missing) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(_load_code_blocks, missing, chunksize=chunksize)
+                )
+        for file, blocks in zip(missing, results):
+            _BLOCKS_BY_FILE[file] = (*signatures[file], blocks)
+
+        # Files that failed to parse are left out, to be reported again
+        parsed = {
+            file: _BLOCKS_BY_FILE[file]
+            for file in files
+            if _BLOCKS_BY_FILE[file][2] is not None
+        }
+        if missing or index.keys() != parsed.keys():
+            _write_cache_file(index_name, parsed)
+        self._store_file_blocks(files)
+
+    def _store_file_blocks(self, files: List[str]):
+        """Stores the memoized code blocks of the given files in `file_blocks`.
+
+        Args:
+            files (List[str]): Paths of files whose blocks are memoized.
+        """
+        for file in files:
+            self.file_blocks[sys.intern(file)] = list(_BLOCKS_BY_FILE[file][2] or ())
 
     @staticmethod
-    def get_code_blocks(file: Path) -> List[Block]:
+    def get_code_blocks(file: Union[str, os.PathLike]) -> List[Block]:
         """Extracts code blocks from a Python file.
 
         Args:
-            file (Path): Path to the file.
+            file (Union[str, os.PathLike]): Path to the file.
 
         Returns:
             List[Block]: Code blocks identified in the file.
         """
-        try:
-            visitor = BlockASTVisitor(file)
-            return visitor.extract_code_blocks()
-        except SyntaxError as e:
-            print(f"Syntax error in file {file}: {e}")
+        file = os.fspath(file)
+        stat = os.stat(file)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = _BLOCKS_BY_FILE.get(file)
+        if cached is None or cached[:2] != signature:
+            cached = _BLOCKS_BY_FILE[file] = (*signature, _load_code_blocks(file))
+        return list(cached[2] or ())
+
+    @staticmethod
+    def get_code_blocks_from_source(
+        source: Union[str, bytes], file: str = "<unknown>"
+    ) -> List[Block]:
+        """Extracts code blocks from Python source, without touching the file system.
+
+        Args:
+            source (Union[str, bytes]): The source code. Text is encoded as UTF-8.
+            file (str): Path to attribute the blocks to.
+
+        Returns:
+            List[Block]: Code blocks identified in the source.
+        """
+        if isinstance(source, str):
+            source = source.encode()
+        if not _may_contain_blocks(source):
             return []
+        blocks = _extract_code_blocks(source, file)
+        return blocks if blocks is not None else []
+
+
+def _iter_python_files(directory: str) -> Iterator[str]:
+    """Yields the paths of all Python files below a directory.
 
+    Walks the tree with os.scandir, which avoids creating a Path object (and
+    matching a glob pattern) for every directory entry. Bytecode caches and
+    version control directories, which hold no Python sources, are skipped,
+    as are directories that are missing or cannot be read.
 
-class BlockASTVisitor(ast.NodeVisitor):
+    Args:
+        directory (str): Directory to search.
+
+    Yields:
+        str: Path of each Python file, joined onto `directory`.
+    """
+    stack = [directory]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in _SKIPPED_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py") and entry.is_file():
+                    yield entry.path
+
+
+@functools.cache
+def _statement_fields(node_type: type) -> tuple[str, ...]:
+    """Names the fields of a node type that hold lists of statements.
+
+    These are the only fields that can contain code blocks. Except handlers
+    and match cases, which are not statements themselves, hold statements
+    in their `body`.
+
+    Args:
+        node_type (type): An `ast.AST` subclass.
+
+    Returns:
+        tuple[str, ...]: The statement list fields, in source order.
+    """
+    if not issubclass(
+        node_type, (ast.mod, ast.stmt, ast.excepthandler, ast.match_case)
+    ):
+        return ()
+    return tuple(
+        name
+        for name in node_type._fields
+        if name in ("body", "handlers", "orelse", "finalbody", "cases")
+    )
+
+
+class BlockASTVisitor:
     """A visitor that traverses the AST of a Python file to extract code blocks.
 
     Attributes:
         file_path (Path): The path of the file being analyzed.
         blocks (List[Block]): A list of Block objects representing the identified code blocks in the file.
         tree (ast.AST): The parsed AST of the Python file.
-        code_lines (List[str]): The lines of code in the file, used for extracting block text.
 
     Args:
         file_path (Path): The path of the Python file to be analyzed.
+        source (Optional[bytes]): The file's contents, if already read.
     """
 
-    def __init__(self, file_path: Path):
+    def __init__(self, file_path: Path, source: Optional[bytes] = None):
         self.file_path = file_path
+        # One shared path string for all blocks of the file
+        self._file_path_str = sys.intern(str(file_path))
         self.blocks = []
 
-        code = self.read_file()
-        self.tree = ast.parse(code)
-        self.code_lines = None  # Initialize to None for lazy loading of lines
-
-    def read_file(self) -> str:
-        """Reads the file's contents.
-
-        Returns:
-            str: The complete text of the file.
-        """
-        return self.file_path.read_text()
+        # Read the file once; both the tree and the code lines derive from it
+        self._source = source if source is not None else file_path.read_bytes()
+        self.tree = ast.parse(self._source, filename=self._file_path_str)
+        self._code_lines = None  # Decoded lazily, when the first block is found
 
     def extract_code_blocks(self) -> list[Block]:
         """Extracts all code blocks in the file by visiting each node in the AST.
 
+        Nodes are visited depth-first in source order using an explicit stack,
+        and dispatched on their type through `_BLOCK_NODE_TYPES`. Only
+        statements are descended into, as blocks never occur in expressions.
+
         Returns:
             List[Block]: A list of Block objects representing the code blocks in the file.
         """
-        self.visit(self.tree)
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            handler = _BLOCK_NODE_TYPES.get(type(node))
+            if handler is not None:
+                block_type, has_else = handler
+                self.add_block(node, block_type)
+                if has_else and node.orelse:
+                    self.add_else_block(node)
+                if block_type == "Try" and node.finalbody:
+                    self.add_finally_block(node)
+            for name in reversed(_statement_fields(type(node))):
+                stack.extend(reversed(getattr(node, name)))
         return self.blocks
 
     def get_code_lines(self) -> list[str]:
-        """Lazily loads and splits the file's code lines for block extraction."""
-        if self.code_lines is None:
-            self.code_lines = self.read_file().splitlines()
-        return self.code_lines
+        """Lazily decodes and splits the file's source into lines for block extraction.
+
+        Lines are split on newlines only, like the parser counts them; decoding
+        already normalises line endings. str.splitlines would also split on
+        e.g. form feeds, shifting the line numbers.
+        """
+        if self._code_lines is None:
+            source = importlib.util.decode_source(self._source)
+            self._code_lines = source.split("\n")
+        return self._code_lines
 
     def add_block(self, node, block_type: str):
         """Helper method to add a block to the list of blocks.
@@ -248,9 +591,20 @@ class BlockASTVisitor(ast.NodeVisitor):
             block_type (str): The type of the code block.
         """
         start_line, end_line = node.lineno, node.body[-1].end_lineno
+        # The whole statement, from its first decorator to its last clause
+        first_line = min(
+            (decorator.lineno for decorator in getattr(node, "decorator_list", ())),
+            default=node.lineno,
+        )
+        segment = (first_line, node.col_offset, node.end_lineno, node.end_col_offset)
         self.blocks.append(
             Block(
-                str(self.file_path), start_line, end_line, block_type, ast.unparse(node)
+                self._file_path_str,
+                start_line,
+                end_line,
+                block_type,
+                source_lines=self.get_code_lines(),
+                segment=segment,
             )
         )
 
@@ -259,82 +613,190 @@ class BlockASTVisitor(ast.NodeVisitor):
         else_start, else_end = node.orelse[0].lineno - 1, node.orelse[-1].end_lineno
         else_code = "\n".join(self.get_code_lines()[else_start:else_end])
         self.blocks.append(
-            Block(str(self.file_path), else_start, else_end, "Else", else_code)
+            Block(self._file_path_str, else_start, else_end, "Else", else_code)
         )
 
-    def visit_FunctionDef(self, node):
-        """Visits function definitions."""
-        self.add_block(node, "Function")
-        self.generic_visit(node)
-
-    def visit_ClassDef(self, node):
-        """Visits class definitions."""
-        self.add_block(node, "Class")
-        self.generic_visit(node)
-
-    def visit_If(self, node):
-        """Visits if statements and their else clauses."""
-        self.add_block(node, "If")
-        if node.orelse:
-            self.add_else_block(node)
-        self.generic_visit(node)
-
-    def visit_For(self, node):
-        """Visits for loops and their else clauses."""
-        self.add_block(node, "For")
-        if node.orelse:
-            self.add_else_block(node)
-        self.generic_visit(node)
-
-    def visit_While(self, node):
-        """Visits while loops and their else clauses."""
-        self.add_block(node, "While")
-        if node.orelse:
-            self.add_else_block(node)
-        self.generic_visit(node)
-
-    def visit_Try(self, node):
-        """Visits try-except blocks, including else and finally clauses."""
-        self.add_block(node, "Try")
-        if node.orelse:
-            self.add_else_block(node)
-        if node.finalbody:
-            finally_start, finally_end = (
+    def add_finally_block(self, node):
+        """Helper to handle 'finally' blocks associated with try statements."""
+        self.blocks.append(
+            Block(
+                self._file_path_str,
                 node.finalbody[0].lineno,
                 node.finalbody[-1].end_lineno,
+                "Finally",
+                source_lines=self.get_code_lines(),
             )
-            finally_code = "\n".join(
-                self.get_code_lines()[finally_start - 1 : finally_end]
-            )
-            self.blocks.append(
-                Block(
-                    str(self.file_path),
-                    finally_start,
-                    finally_end,
-                    "Finally",
-                    finally_code,
-                )
-            )
-        self.generic_visit(node)
-
-    def visit_With(self, node):
-        """Visits with statements."""
-        self.add_block(node, "With")
-        self.generic_visit(node)
-
-    def visit_AsyncFunctionDef(self, node):
-        """Visits asynchronous function definitions."""
-        self.add_block(node, "Async Function")
-        self.generic_visit(node)
-
-    def visit_AsyncFor(self, node):
-        """Visits asynchronous for loops and their else clauses."""
-        self.add_block(node, "Async For")
-        if node.orelse:
-            self.add_else_block(node)
-        self.generic_visit(node)
-
-    def visit_AsyncWith(self, node):
-        """Visits asynchronous with statements."""
-        self.add_block(node, "Async With")
-        self.generic_visit(node)
+        )
+
+
+def _may_contain_blocks(source: bytes) -> bool:
+    """Checks whether a source could contain any code blocks, without parsing it.
+
+    Every block starts with one of a few keywords, so sources lacking all of
+    them (e.g. empty files, or modules of imports and constants) have none.
+    The check is a plain substring scan, so it may yield false positives.
+
+    Args:
+        source (bytes): The source code.
+
+    Returns:
+        bool: False if the source certainly contains no code blocks.
+    """
+    return any(keyword in source for keyword in _BLOCK_KEYWORDS)
+
+
+def _extract_code_blocks(source: bytes, file: str) -> Optional[List[Block]]:
+    """Parses a source and extracts its code blocks, reporting syntax errors.
+
+    Args:
+        source (bytes): The source code.
+        file (str): Path to attribute the blocks to.
+
+    Returns:
+        Optional[List[Block]]: Code blocks identified in the source, or None
+            if the source could not be parsed.
+    """
+    try:
+        return BlockASTVisitor(Path(file), source).extract_code_blocks()
+    except SyntaxError as e:
+        print(f"Syntax error in file {file}: {e}")
+        return None
+
+
+def _load_code_blocks(file: str) -> Optional[List[Block]]:
+    """Extracts the code blocks of a file, going through the on-disk block cache.
+
+    Cache entries are keyed by a digest of the interpreter and the file's
+    path and contents, so unchanged files are never parsed twice. Within a
+    process, callers additionally memoize results in `_BLOCKS_BY_FILE` on the
+    file's stat signature, which skips reading and hashing the file. Files
+    that fail to parse are not cached, so their syntax error is reported on
+    every run.
+
+    Args:
+        file (str): Path to the file.
+
+    Returns:
+        Optional[List[Block]]: Code blocks identified in the file, or None if
+            it could not be parsed.
+    """
+    source = Path(file).read_bytes()
+    if not _may_contain_blocks(source):
+        return []  # Not worth a parse, nor a cache entry
+    cache_name = _cache_key(file.encode() + b"\0" + source) + ".pkl"
+    blocks = _read_cache_file(cache_name)
+    if blocks is not None:
+        return blocks
+
+    blocks = _extract_code_blocks(source, file)
+    if blocks is not None:
+        _write_cache_file(cache_name, blocks)
+    return blocks
+
+
+def _cache_key(data: bytes) -> str:
+    """Derives the name of a block cache entry, specific to this interpreter.
+
+    Args:
+        data (bytes): What the entry depends on, besides the interpreter.
+
+    Returns:
+        str: A hex digest to name the entry by.
+    """
+    return hashlib.blake2b(_CACHE_KEY_TAG + data).hexdigest()
+
+
+def _block_cache_dir() -> Optional[Path]:
+    """Locates the on-disk block cache.
+
+    The cache holds pickled block lists, keyed by interpreter, file path and
+    contents (see `_load_code_blocks`), and block indexes of whole directories
+    (see `collect_code_blocks_for_directory`). It lives under
+    ``$XDG_CACHE_HOME/coverageanalyzer``, unless relocated through the
+    ``COVERAGEANALYZER_CACHE_DIR`` environment variable, and is disabled if
+    ``COVERAGEANALYZER_NO_CACHE`` is set.
+
+    Returns:
+        Optional[Path]: The cache directory, or None if caching is disabled.
+    """
+    if os.environ.get(_NO_CACHE_ENV):
+        return None
+    root = os.environ.get(_CACHE_DIR_ENV) or (
+        Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+        / "coverageanalyzer"
+    )
+    return Path(root) / _BLOCK_CACHE_VERSION
+
+
+def _read_cache_file(name: str):
+    """Reads an entry of the on-disk block cache, marking it as recently used.
+
+    Args:
+        name (str): File name of the entry.
+
+    Returns:
+        The unpickled entry, or None if it is missing or unreadable, or if
+        caching is disabled.
+    """
+    cache_dir = _block_cache_dir()
+    if cache_dir is None:
+        return None
+    cache_file = cache_dir / name
+    try:
+        with open(cache_file, "rb") as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+    with contextlib.suppress(OSError):
+        os.utime(cache_file)  # Entries unused for long are pruned
+    return entry
+
+
+def _write_cache_file(name: str, entry):
+    """Writes an entry of the on-disk block cache, atomically.
+
+    Failures are ignored, as the cache is an optimization only.
+
+    Args:
+        name (str): File name of the entry.
+        entry: The object to pickle.
+    """
+    cache_dir = _block_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+            pickle.dump(entry, f)
+        os.replace(f.name, cache_dir / name)
+    except OSError:
+        pass
+    _prune_block_cache(cache_dir)
+
+
+@functools.cache
+def _prune_block_cache(cache_dir: Path):
+    """Removes outdated parts of the on-disk block cache, once per process.
+
+    These are caches of other layout versions, and entries that were not
+    used for `_BLOCK_CACHE_MAX_AGE` seconds (e.g. of since changed files, or
+    of temporary projects).
+
+    Args:
+        cache_dir (Path): The block cache directory.
+    """
+    with contextlib.suppress(OSError), os.scandir(cache_dir.parent) as entries:
+        for entry in entries:
+            if (
+                entry.name.startswith("blocks-v")
+                and entry.name != cache_dir.name
+                and entry.is_dir(follow_symlinks=False)
+            ):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    cutoff = time.time() - _BLOCK_CACHE_MAX_AGE
+    with contextlib.suppress(OSError), os.scandir(cache_dir) as entries:
+        for entry in entries:
+            with contextlib.suppress(OSError):
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
@@ -1,17 +1,40 @@
+import contextlib
+import glob
 import os
+import runpy
+import site
+import subprocess
+import sys
+import sysconfig
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 import coverage
-import subprocess
 
 from .report import CoverageReport
 from .analyzer import CoverageAnalyzer
 
+# Set to let tests print to the terminal instead of discarding their output
+_TEST_OUTPUT_ENV = "COVERAGEANALYZER_TEST_OUTPUT"
+
+# Installed packages and the standard library. Their modules are not evicted
+# after an in-process test if they live below the project, e.g. in a .venv
+_LIBRARY_PREFIXES = tuple(
+    os.path.join(os.path.abspath(path), "")
+    for path in {
+        *map(sysconfig.get_path, ("stdlib", "platstdlib", "purelib", "platlib")),
+        *site.getsitepackages(),
+        site.getusersitepackages(),
+    }
+)
+
 
 class LineCoverageReport(CoverageReport):
     """
     Coverage report detailing coverage data and executable lines.
 
+    Line sets are immutable, so that reports can share them.
+
     Attributes:
         coverage_data: Dictionary with files as keys and covered lines as values.
         total_executable_lines: Dictionary with files as keys and all executable lines as values.
@@ -19,12 +42,14 @@ class LineCoverageReport(CoverageReport):
 
     def __init__(
         self,
-        coverage_data: dict[str, set[int]],
-        total_executable_lines: dict[str, set[int]],
+        coverage_data: dict[str, frozenset[int]],
+        total_executable_lines: dict[str, frozenset[int]],
     ):
         super().__init__()
         self.coverage_data = coverage_data
         self.total_executable_lines = total_executable_lines
+        # Reports do not change after construction, so the total is memoized
+        self._total_cov: Optional[float] = None
 
     def get_file_coverage(self, file: str) -> float:
         """
@@ -41,7 +66,7 @@ class LineCoverageReport(CoverageReport):
 
         total_lines = len(self.total_executable_lines[file])
         covered_lines = len(self.coverage_data[file])
-        return covered_lines / total_lines
+        return covered_lines / total_lines if total_lines > 0 else 0.0
 
     def get_total_coverage(self) -> float:
         """
@@ -50,14 +75,16 @@ class LineCoverageReport(CoverageReport):
         Returns:
             The total coverage as a float between 0 and 1.
         """
-        total_lines = sum(len(lines) for lines in self.total_executable_lines.values())
-        covered_lines = sum(len(lines) for lines in self.coverage_data.values())
-        return covered_lines / total_lines
+        if self._total_cov is None:
+            total_lines = sum(map(len, self.total_executable_lines.values()))
+            covered_lines = sum(map(len, self.coverage_data.values()))
+            self._total_cov = covered_lines / total_lines if total_lines > 0 else 0.0
+        return self._total_cov
 
     def __repr__(self):
         return (
             f"CoverageReport("
-            f"{[str(Path(file).name) + ': ' + str(lines) for file, lines in self.coverage_data.items()]}, "
+            f"{[str(Path(file).name) + ': ' + str(set(lines)) for file, lines in self.coverage_data.items()]}, "
             f"coverage={self.get_total_coverage()})"
         )
 
@@ -69,6 +96,9 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
         project_root: Root directory of the project.
         harness: Optional path to a test harness.
         output: Optional path to coverage output file.
+        isolated: Whether to run each test in its own ``coverage run``
+            subprocess instead of in this process. Isolated tests run
+            concurrently, one per core.
     """
 
     def __init__(
@@ -76,10 +106,36 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
         project_root: os.PathLike,
         harness: Optional[os.PathLike] = None,
         output: Optional[os.PathLike] = None,
+        isolated: bool = False,
     ):
         super().__init__(project_root)
+        if sys.version_info >= (3, 12):
+            # Measure through sys.monitoring (PEP 669) instead of sys.settrace,
+            # unless the user picked a core explicitly.
+            os.environ.setdefault("COVERAGE_CORE", "sysmon")
         self.output = output if output else Path(project_root) / ".coverage"
         self.harness = harness if harness else Path(project_root) / "harness.py"
+        self.isolated = isolated
+        # Absolute paths, resolved once, as tests run from within the project
+        self._root_path = os.path.abspath(self.project_root)
+        self._harness_path = os.path.abspath(self.harness)
+        self._output_path = os.path.abspath(self.output)
+        # Like `coverage run` in the project, read the project's configuration
+        in_project = (
+            contextlib.chdir(self._root_path)
+            if os.path.isdir(self._root_path)
+            else contextlib.nullcontext()
+        )
+        with in_project:
+            self._cov = coverage.Coverage(
+                data_file=self._output_path, source=[self._root_path]
+            )
+        # Data left by previous runs is only read when it is first needed
+        self._data_loaded = False
+        # Measured files are reported by their resolved path
+        self._project_prefix = os.path.join(Path(self.project_root).resolve(), "")
+        # Executable lines by file, with the mtime_ns and size they were read at
+        self._executable_lines: dict[str, tuple[int, int, frozenset[int]]] = {}
 
     def __enter__(self):
         """Enter the runtime context related to this object."""
@@ -101,15 +157,36 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
         Returns:
             A dictionary with file paths as keys and sets of executable line numbers as values.
         """
-        all_executable_lines = dict()
-        data = cov.get_data()
-        for file in data.measured_files():
-            analysis = cov.analysis2(file)
-            executable_lines = analysis[1]
-            all_executable_lines[file] = set(executable_lines)
-        return all_executable_lines
+        return {
+            file: set(cov.analysis2(file)[1])
+            for file in cov.get_data().measured_files()
+        }
 
-    def analyze_coverage_data(self) -> tuple[dict[str, set[int]], dict[str, set[int]]]:
+    def _get_executable_lines(self, file: str) -> frozenset[int]:
+        """
+        Fetches the cached set of executable lines of a measured file.
+
+        coverage.py parses the source file to find them, so results are cached
+        until the file changes. They depend on the coverage configuration, so
+        each analyzer keeps its own cache.
+
+        Args:
+            file: The path of a file with coverage data.
+
+        Returns:
+            A frozenset with the executable line numbers of the file.
+        """
+        stat = os.stat(file)
+        cached = self._executable_lines.get(file)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        lines = frozenset(self._cov.analysis2(file)[1])
+        self._executable_lines[file] = (stat.st_mtime_ns, stat.st_size, lines)
+        return lines
+
+    def analyze_coverage_data(
+        self,
+    ) -> tuple[dict[str, frozenset[int]], dict[str, frozenset[int]]]:
         """
         Analyzes the coverage data after test execution.
 
@@ -119,44 +196,150 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
                 - total_executable_lines: Dictionary with all executable lines for each file.
         """
         coverage_data = dict()
-        cov = coverage.Coverage(data_file=self.output)
-        cov.load()
-        total_executable_lines = self.get_all_executable_lines(cov)
+        total_executable_lines = dict()
+        # The live instance already holds the data in memory
+        self._load_data()
+        data = self._cov.get_data()
 
-        for file in cov.get_data().measured_files():
-            lines = cov.get_data().lines(file)
-            clean_lines = total_executable_lines[file].intersection(lines)
-            coverage_data[file] = set(clean_lines)
+        for file in data.measured_files():
+            if not file.startswith(self._project_prefix):
+                continue  # E.g. data combined from runs of other projects
+            # Reports share the cached set instead of each holding a copy
+            executable_lines = self._get_executable_lines(file)
+            total_executable_lines[file] = executable_lines
+            if not executable_lines:
+                # E.g. an empty __init__.py; skip querying its covered lines
+                coverage_data[file] = executable_lines
+                continue
+            coverage_data[file] = executable_lines.intersection(data.lines(file))
 
         return coverage_data, total_executable_lines
 
-    def _run_command_for_test(self, command: list[str], test: str):
+    def _run_test_inproc(self, test: str):
         """
-        Runs coverage for a specific test.
+        Runs the harness for a specific test in this process under coverage.
+
+        The harness is executed as ``__main__`` with ``sys.argv`` patched, from
+        within the project root, just like ``coverage run harness.py test``
+        would. Modules imported from the project (or the harness's directory)
+        are dropped afterward so that the next test imports (and measures) them
+        afresh. Installed packages below the project root, e.g. in a
+        ``.venv``, are kept.
 
         Args:
-            command: List of command components to run.
             test: The specific test script or command.
-
-        Returns:
-            The result of the subprocess execution.
-        """
-        result = subprocess.run(
-            command + [self.harness, test],
-            text=True,
-            cwd=self.project_root,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+        """
+        self._load_data()
+        harness = self._harness_path
+        watched = (
+            os.path.join(self._root_path, ""),
+            os.path.join(os.path.dirname(harness), ""),
+        )
+        # Only libraries strictly inside a watched directory are exempt, so a
+        # project that is itself installed still has its modules evicted
+        kept = tuple(
+            prefix
+            for prefix in _LIBRARY_PREFIXES
+            if prefix.startswith(watched) and prefix not in watched
         )
-        return result
+        saved_argv, saved_path = sys.argv, sys.path[:]
+        saved_modules = set(sys.modules)
+        sys.argv = [harness, test]
+        sys.path.insert(0, os.path.dirname(harness))
+        try:
+            with contextlib.chdir(self._root_path), _discard_test_output():
+                self._cov.start()
+                try:
+                    runpy.run_path(harness, run_name="__main__")
+                except (Exception, SystemExit):
+                    pass  # A failing test still contributes its coverage
+                finally:
+                    self._cov.stop()
+        finally:
+            sys.argv = saved_argv
+            sys.path[:] = saved_path
+            for name in set(sys.modules) - saved_modules:
+                file = getattr(sys.modules[name], "__file__", None) or ""
+                if file.startswith(watched) and not file.startswith(kept):
+                    del sys.modules[name]
+
+    def _run_tests_isolated(self, tests: list[str]):
+        """
+        Runs the tests concurrently in ``coverage run`` subprocesses.
+
+        The subprocesses run in parallel mode, so each writes its own
+        ``<output>.<host>.<pid>.<random>`` data file next to the analyzer's data
+        file. These are combined into the analyzer's in-memory data afterward.
+
+        Args:
+            tests: The test scripts or commands to run.
+        """
+        self._load_data()
+        # Nobody reads the output, so do not pipe it back into this process
+        output = None if os.environ.get(_TEST_OUTPUT_ENV) else subprocess.DEVNULL
+        command = [
+            sys.executable,
+            "-m",
+            "coverage",
+            "run",
+            "--parallel-mode",
+            f"--data-file={self._output_path}",
+            f"--source={self._root_path}",
+            self._harness_path,
+        ]
+
+        def run(test: str):
+            return subprocess.run(
+                command + [test],
+                cwd=self.project_root,
+                stdout=output,
+                stderr=output,
+            )
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            list(executor.map(run, tests))
+
+        # Merge into the live data, which saves re-reading the data file
+        self._cov.combine()
+        self._cov.save()
+
+    def _run_tests(self, tests: list[str]):
+        """
+        Runs the tests under coverage and saves their data.
+
+        Args:
+            tests: The test scripts or commands to run.
+        """
+        if self.isolated:
+            self._run_tests_isolated(tests)
+        else:
+            for test in tests:
+                self._run_test_inproc(test)
+            self._cov.save()
+
+    def _load_data(self):
+        """
+        Loads the coverage data left by previous runs, once.
+
+        Deferred until first needed, so that analyzers which start by erasing
+        the data (e.g. ``get_coverage(clean=True)``) never read the data file.
+        """
+        if not self._data_loaded:
+            self._cov.load()
+            self._data_loaded = True
 
     def clean_coverage(self):
         """
         Removes existing coverage data.
+
+        This includes parallel data files left behind by interrupted isolated
+        runs, which the next combine would otherwise pick up.
         """
-        subprocess.run(
-            ["coverage", "erase", f"--data-file={self.output}"], cwd=self.project_root
-        )
+        self._cov.erase()
+        for file in glob.glob(glob.escape(self._output_path) + ".*"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(file)
+        self._data_loaded = True  # Nothing left to load
 
     def get_coverage(self, tests: list[str], clean: bool = True) -> LineCoverageReport:
         """Run the provided tests with coverage and analyze results.
@@ -171,17 +354,7 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
         if clean:
             self.clean_coverage()
 
-        command = [
-            "coverage",
-            "run",
-            f"--data-file={self.output}",
-            f"--source={self.project_root}",
-        ]
-        if len(tests) > 1:
-            command.append("--append")
-
-        for test in tests:
-            self._run_command_for_test(command, test)
+        self._run_tests(tests)
 
         coverage_data, total_executable_lines = self.analyze_coverage_data()
         return LineCoverageReport(coverage_data, total_executable_lines)
@@ -202,13 +375,40 @@ class CoveragePyAnalyzer(CoverageAnalyzer):
         Returns:
             A CoverageReport with updated coverage data.
         """
-        command = [
-            "coverage",
-            "run",
-            f"--data-file={self.output}",
-            f"--source={self.project_root}",
-            "--append",
-        ]
-        self._run_command_for_test(command, test)
+        self._run_tests([test])
         coverage_data, total_executable_lines = self.analyze_coverage_data()
         return LineCoverageReport(coverage_data, total_executable_lines)
+
+    def append_coverage_batch(self, tests: list[str]) -> list[LineCoverageReport]:
+        """
+        Appends coverage data for several tests, one after the other.
+
+        This is the same as calling :meth:`append_coverage` for each test: the
+        data file is updated with every test's coverage.
+
+        Args:
+            tests: The test scripts or commands to run.
+
+        Returns:
+            One CoverageReport per test, each including the coverage of all
+            tests up to and including it.
+        """
+        return [self.append_coverage(test) for test in tests]
+
+
+@contextlib.contextmanager
+def _discard_test_output():
+    """Discards what in-process tests print, unless asked not to.
+
+    Output is kept if the ``COVERAGEANALYZER_TEST_OUTPUT`` environment
+    variable is set, which helps debugging harnesses.
+    """
+    if os.environ.get(_TEST_OUTPUT_ENV):
+        yield
+        return
+    with (
+        open(os.devnull, "w") as sink,
+        contextlib.redirect_stdout(sink),
+        contextlib.redirect_stderr(sink),
+    ):
+        yield
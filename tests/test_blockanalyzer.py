@@ -1,17 +1,61 @@
+import ast
+import functools
+import logging
+import os
 import unittest
+import pickle
 import tempfile
 from pathlib import Path
+from unittest import mock
 
+from coverageanalyzer import block as block_module
 from coverageanalyzer.block import BlockCoverageReport, Block, BlockCoveragePyAnalyzer
 
+# Details of coverage runs, shown with e.g. pytest --log-level=DEBUG
+logger = logging.getLogger(__name__)
+
 
 class TestBlockAnalyzer(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        """Set up one analyzer for the calc project, shared by all tests."""
+        # Tests get their own project directories below one shared directory
+        cls.test_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.test_dir.cleanup)
+        # Keep the block cache out of the user's cache directory
+        cls.cache_dir = Path(cls.test_dir.name) / "cache"
+        cls.cache_env = mock.patch.dict(
+            os.environ, {"COVERAGEANALYZER_CACHE_DIR": str(cls.cache_dir)}
+        )
+        cls.cache_env.start()
+        cls.addClassCleanup(cls.cache_env.stop)
+
+        cls.analyzer = BlockCoveragePyAnalyzer(
+            project_root=Path.cwd() / "resources" / "project",
+            harness=Path.cwd() / "resources" / "harness.py",
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the coverage data of the shared analyzer."""
+        cls._cached_report.cache_clear()
+        cls.analyzer.reset()
+
+    @classmethod
+    @functools.lru_cache(maxsize=8)
+    def _cached_report(cls, tests: tuple[str, ...]) -> BlockCoverageReport:
+        """Runs the given tests from clean coverage data, once per class.
+
+        Reports are not modified after construction, so tests can share them.
+        """
+        return cls.analyzer.get_coverage(tests=list(tests), clean=True)
+
     def setUp(self):
         """Set up temporary test files for BlockAnalyzer tests."""
-        # Create a temporary directory to hold test files
-        self.test_dir = tempfile.TemporaryDirectory()
-        self.project_root = Path(self.test_dir.name)
+        # Create a directory to hold this test's files
+        self.project_root = Path(self.test_dir.name) / self._testMethodName
+        self.project_root.mkdir()
 
         # Sample Python content for testing various block types
         self.sample_code = """\
@@ -35,15 +79,8 @@ else:
         self.test_file = self.project_root / "test_file.py"
         self.test_file.write_text(self.sample_code)
 
-        calc_project_root = Path.cwd() / "resources" / "project"
-        calc_harness_path = Path.cwd() / "resources" / "harness.py"
-        self.analyzer = BlockCoveragePyAnalyzer(
-            project_root=calc_project_root, harness=calc_harness_path
-        )
-
-    def tearDown(self):
-        """Clean up temporary files."""
-        self.test_dir.cleanup()
+        # Start every test from empty coverage data
+        self.analyzer.reset()
 
     def test_collect_code_blocks_for_directory(self):
         """Test that BlockAnalyzer correctly identifies code blocks in a directory."""
@@ -64,6 +101,11 @@ else:
         for expected_type in expected_types:
             self.assertIn(expected_type, block_types)
 
+    def test_collect_code_blocks_for_missing_directory(self):
+        """Test that BlockAnalyzer finds no code blocks in a missing directory."""
+        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root / "missing")
+        self.assertEqual(analyzer.file_blocks, {})
+
     def test_block_attributes(self):
         """Test that extracted blocks have correct attributes for line numbers and code."""
         analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
@@ -81,31 +123,70 @@ else:
         self.assertEqual(second_block.start_line, 2)
         self.assertIn("def method(self):", second_block.code)
 
+    def test_block_code_is_unparsed_node(self):
+        """Test that block code matches ast.unparse of the block's node."""
+        source = (
+            "class A:\n"
+            "    @staticmethod\n"
+            "    @property\n"
+            "    def f(x):  # comment\n"
+            "        if x > 1:\n"
+            "            return 1\n"
+            "        elif x > 2:\n"
+            "            return 2\n"
+            "        else:\n"
+            "            return 3\n"
+        )
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks_from_source(source, "a.py")
+        class_node = ast.parse(source).body[0]
+        function_node = class_node.body[0]
+        if_node = function_node.body[0]
+        nodes = {
+            "Class": [class_node],
+            "Function": [function_node],
+            "If": [if_node, if_node.orelse[0]],
+        }
+        for block_type, expected in nodes.items():
+            self.assertEqual(
+                [block.code for block in blocks if block.type == block_type],
+                [ast.unparse(node) for node in expected],
+            )
+
+    def test_block_code_with_form_feed(self):
+        """Test that form feeds, which are not line breaks to the parser, keep block code intact."""
+        source = "x = 1\n\x0c\ndef f():\n    return 1\n"
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks_from_source(source, "a.py")
+        self.assertEqual([block.code for block in blocks], ["def f():\n    return 1"])
+
     def test_syntax_error_handling(self):
         """Test that BlockAnalyzer handles files with syntax errors gracefully."""
-        # Create a file with a syntax error
-        syntax_error_file = self.project_root / "syntax_error.py"
-        syntax_error_file.write_text("def func()\n    return")  # Missing colon
-
-        # Run BlockAnalyzer
-        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks_from_source(
+            "def func()\n    return", "syntax_error.py"  # Missing colon
+        )
 
-        # Assert that syntax error file was processed and no blocks were extracted
-        self.assertIn(str(syntax_error_file), analyzer.file_blocks)
-        self.assertEqual(analyzer.file_blocks[str(syntax_error_file)], [])
+        # Assert that no blocks were extracted
+        self.assertEqual(blocks, [])
 
     def test_empty_file(self):
         """Test that BlockAnalyzer handles an empty file correctly."""
-        # Create an empty file
-        empty_file = self.project_root / "empty_file.py"
-        empty_file.touch()
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks_from_source(
+            "", "empty_file.py"
+        )
 
-        # Run BlockAnalyzer
-        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+        # Assert that no blocks were extracted
+        self.assertEqual(blocks, [])
+
+    def test_code_blocks_from_source(self):
+        """Test that blocks extracted from source match those extracted from the file."""
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks_from_source(
+            self.sample_code, str(self.test_file)
+        )
+        file_blocks = BlockCoveragePyAnalyzer.get_code_blocks(self.test_file)
 
-        # Assert that empty file was processed and no blocks were extracted
-        self.assertIn(str(empty_file), analyzer.file_blocks)
-        self.assertEqual(analyzer.file_blocks[str(empty_file)], [])
+        self.assertEqual(blocks, file_blocks)
+        self.assertEqual(
+            [block.code for block in blocks], [block.code for block in file_blocks]
+        )
 
     def test_multiple_files_in_directory(self):
         """Test that BlockAnalyzer processes multiple files in a directory."""
@@ -113,6 +194,9 @@ else:
         additional_file = self.project_root / "additional_file.py"
         additional_code = "def another_function():\n    pass\n"
         additional_file.write_text(additional_code)
+        # A file with a syntax error must not stop the others from being processed
+        syntax_error_file = self.project_root / "syntax_error.py"
+        syntax_error_file.write_text("def func()\n    return")
 
         # Run BlockAnalyzer
         analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
@@ -125,6 +209,109 @@ else:
         # Assert the correct number of blocks are identified in each file
         self.assertEqual(len(file_blocks[str(self.test_file)]), 7)
         self.assertEqual(len(file_blocks[str(additional_file)]), 1)
+        self.assertEqual(file_blocks[str(syntax_error_file)], [])
+
+    def test_syntax_errors_are_reported_every_time(self):
+        """Test that files with syntax errors are not cached, so every load reports them."""
+        syntax_error_file = self.project_root / "syntax_error.py"
+        syntax_error_file.write_text("def func()\n    return")
+
+        for _ in range(2):
+            with mock.patch("builtins.print") as print_mock:
+                blocks = block_module._load_code_blocks(str(syntax_error_file))
+            self.assertIsNone(blocks)
+            print_mock.assert_called_once()
+
+        # Nor are they kept in the block index of a directory
+        for i in range(20):
+            (self.project_root / f"module_{i}.py").write_text(self.sample_code)
+        for _ in range(2):
+            # Forget the blocks memoized in this process, as a new process would
+            block_module._BLOCKS_BY_FILE.clear()
+            with (
+                mock.patch("builtins.print") as print_mock,
+                mock.patch.object(block_module, "_PARALLEL_MIN_FILES", 100),
+            ):
+                analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+            self.assertEqual(analyzer.file_blocks[str(syntax_error_file)], [])
+            print_mock.assert_called_once()
+
+    def test_collect_code_blocks_in_parallel(self):
+        """Test that large directories, parsed in worker processes, yield the same blocks."""
+        for i in range(20):
+            (self.project_root / f"module_{i}.py").write_text(self.sample_code)
+
+        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+
+        self.assertEqual(len(analyzer.file_blocks), 21)
+        for file, blocks in analyzer.file_blocks.items():
+            self.assertEqual(len(blocks), 7)
+            self.assertTrue(all(block.file_path == file for block in blocks))
+
+    def test_code_blocks_follow_file_changes(self):
+        """Test that cached code blocks are refreshed when a file changes."""
+        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+        self.assertEqual(len(analyzer.file_blocks[str(self.test_file)]), 7)
+
+        # Rewrite the file with different content (and size)
+        self.test_file.write_text("def only_function():\n    pass\n")
+        blocks = BlockCoveragePyAnalyzer.get_code_blocks(self.test_file)
+        self.assertEqual([block.type for block in blocks], ["Function"])
+
+    def test_code_blocks_from_directory_index(self):
+        """Test that a new process reuses the directory's block index instead of loading files."""
+        # Only trees with enough files are indexed
+        for i in range(20):
+            (self.project_root / f"module_{i}.py").write_text(self.sample_code)
+        analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+
+        # Forget the blocks memoized in this process, as a new process would
+        block_module._BLOCKS_BY_FILE.clear()
+        with mock.patch.object(block_module, "_load_code_blocks") as load_code_blocks:
+            indexed_analyzer = BlockCoveragePyAnalyzer(project_root=self.project_root)
+
+        load_code_blocks.assert_not_called()
+        self.assertEqual(indexed_analyzer.file_blocks, analyzer.file_blocks)
+
+    def test_block_cache_location_and_pruning(self):
+        """Test that the block cache can be relocated and disabled, and prunes outdated entries."""
+        cache_root = self.project_root / "cache"
+        stale_version = cache_root / "blocks-v0"
+        stale_version.mkdir(parents=True)
+        cache_dir = cache_root / block_module._BLOCK_CACHE_VERSION
+        cache_dir.mkdir()
+        stale_entry = cache_dir / "stale.pkl"
+        stale_entry.touch()
+        os.utime(stale_entry, (0, 0))
+
+        block_module._BLOCKS_BY_FILE.clear()
+        with mock.patch.dict(
+            os.environ, {"COVERAGEANALYZER_CACHE_DIR": str(cache_root)}
+        ):
+            with mock.patch.dict(os.environ, {"COVERAGEANALYZER_NO_CACHE": "1"}):
+                BlockCoveragePyAnalyzer.get_code_blocks(self.test_file)
+            self.assertEqual(list(cache_dir.iterdir()), [stale_entry])
+
+            block_module._BLOCKS_BY_FILE.clear()
+            BlockCoveragePyAnalyzer.get_code_blocks(self.test_file)
+
+        self.assertFalse(stale_version.exists())
+        self.assertFalse(stale_entry.exists())
+        self.assertEqual(len(list(cache_dir.iterdir())), 1)
+
+    def test_block_cache_is_per_interpreter(self):
+        """Test that interpreters, which may parse sources differently, do not share cache entries."""
+        cache_root = self.project_root / "cache"
+        cache_dir = cache_root / block_module._BLOCK_CACHE_VERSION
+        with mock.patch.dict(
+            os.environ, {"COVERAGEANALYZER_CACHE_DIR": str(cache_root)}
+        ):
+            for tag in (b"cpython-312\0", b"cpython-314\0"):
+                block_module._BLOCKS_BY_FILE.clear()
+                with mock.patch.object(block_module, "_CACHE_KEY_TAG", tag):
+                    BlockCoveragePyAnalyzer.get_code_blocks(self.test_file)
+
+        self.assertEqual(len(list(cache_dir.iterdir())), 2)
 
     def test_repr_method_in_block(self):
         """Test that Block's __repr__ method produces the expected output."""
@@ -138,65 +325,85 @@ else:
         repr_output = repr(block)
         self.assertEqual(repr_output, "Block(type=Function, lines=1-5)")
 
+    def test_block_equality_and_pickling(self):
+        """Test that blocks compare by location and type, and survive pickling."""
+        block = Block("f.py", 1, 5, "Function", "def f():\n    pass")
+        same = Block("f.py", 1, 5, "Function", "other code")
+        self.assertEqual(block, same)
+        self.assertEqual(hash(block), hash(same))
+        self.assertNotEqual(block, Block("f.py", 1, 5, "Class", ""))
+        with self.assertRaises(AttributeError):
+            block.start_line = 3
+
+        restored = pickle.loads(pickle.dumps(block))
+        self.assertEqual(restored, block)
+        self.assertEqual(restored.code, block.code)
+        self.assertIs(restored.type, block.type)  # Type strings are interned
+        self.assertIn(restored, {block})
+
     def test_block_coverage_analyzer(self):
         """Test that BlockAnalyzer can track coverage for blocks."""
-
-        # Initialize a BlockAnalyzer object
-        analyzer = BlockCoveragePyAnalyzer(
-            project_root=Path.cwd() / "resources" / "project",
-            harness=Path.cwd() / "resources" / "harness.py",
-        )
-
-        report = analyzer.get_coverage(
-            tests=["sqrt(12)", "tan(10)", "sin(0)"], clean=True
-        )
+        report = self._cached_report(("sqrt(12)", "tan(10)", "sin(0)"))
 
         for file, blocks in report.total_executable_blocks.items():
             for block in blocks:
-                print(block)
-                print(block.code)
-                print(report.is_block_covered(block))
-
-        print("Initial Coverage Report:", report)
-        print(f"Total Project Coverage: {report.get_total_coverage() * 100:.2f}%")
+                logger.debug(
+                    "%s covered: %s\n%s",
+                    block,
+                    report.is_block_covered(block),
+                    block.code,
+                )
 
-        # Final reset after coverage tracking
-        analyzer.reset()
+        logger.debug("Initial Coverage Report: %s", report)
+        logger.debug(
+            "Total Project Coverage: %.2f%%", report.get_total_coverage() * 100
+        )
 
     def test_block_coverage_report_initialization(self):
         """Test initializing a BlockCoveragePyAnalyzer and generating a BlockCoverageReport."""
-        report = self.analyzer.get_coverage(
-            tests=["sqrt(12)", "tan(10)", "sin(0)"], clean=True
-        )
+        report = self._cached_report(("sqrt(12)", "tan(10)", "sin(0)"))
 
         self.assertIsInstance(report, BlockCoverageReport)
         self.assertEqual(report.get_total_coverage(), 0.75)
 
     def test_block_coverage_per_file(self):
         """Test block coverage calculation for individual files."""
-        report = self.analyzer.get_coverage(
-            tests=["sqrt(12)", "tan(10)", "sin(0)"], clean=True
-        )
+        report = self._cached_report(("sqrt(12)", "tan(10)", "sin(0)"))
 
         for file, blocks in report.total_executable_blocks.items():
             file_coverage = report.get_file_coverage(file)
             self.assertGreaterEqual(file_coverage, 0.0)
             self.assertLessEqual(file_coverage, 1.0)
-            print(f"Coverage for {file}: {file_coverage * 100:.2f}%")
+            logger.debug("Coverage for %s: %.2f%%", file, file_coverage * 100)
+
+    def test_block_coverage_report_line_ranges(self):
+        """Test that a block counts as covered only by lines within its body."""
+        outer = Block("f.py", 1, 10, "Function", "")
+        inner = Block("f.py", 3, 5, "If", "")
+        other = Block("f.py", 12, 14, "Function", "")
+        report = BlockCoverageReport(
+            {"f.py": {1, 2, 6, 12}}, {"f.py": [outer, inner, other]}
+        )
+
+        self.assertTrue(report.is_block_covered(outer))
+        self.assertFalse(report.is_block_covered(inner))
+        self.assertFalse(report.is_block_covered(other))
+        self.assertAlmostEqual(report.get_file_coverage("f.py"), 1 / 3)
 
     def test_block_is_covered(self):
         """Test that specific blocks are marked as covered when appropriate."""
-        report = self.analyzer.get_coverage(
-            tests=["sqrt(12)", "tan(10)", "sin(0)"], clean=True
-        )
+        report = self._cached_report(("sqrt(12)", "tan(10)", "sin(0)"))
 
         covered_blocks_count = 0
         for file, blocks in report.total_executable_blocks.items():
             for block in blocks:
                 if report.is_block_covered(block):
                     covered_blocks_count += 1
-                print(
-                    f"Block {block.type} in {file} covered: {report.is_block_covered(block)}"
+                logger.debug(
+                    "Block %s in %s covered: %s",
+                    block.type,
+                    file,
+                    report.is_block_covered(block),
                 )
 
         self.assertGreater(covered_blocks_count, 0, "No blocks were marked as covered")
@@ -213,8 +420,9 @@ else:
         total_coverage_after_reset = report_after_reset.get_total_coverage()
         self.assertGreaterEqual(total_coverage_after_reset, 0.0)
         self.assertLessEqual(total_coverage_after_reset, 1.0)
-        print(
-            f"Total Project Coverage after reset: {total_coverage_after_reset * 100:.2f}%"
+        logger.debug(
+            "Total Project Coverage after reset: %.2f%%",
+            total_coverage_after_reset * 100,
         )
 
     def test_coverage_append(self):
@@ -226,7 +434,7 @@ else:
         appended_coverage = appended_report.get_total_coverage()
 
         self.assertGreaterEqual(appended_coverage, initial_coverage)
-        print(f"Coverage after appending: {appended_coverage * 100:.2f}%")
+        logger.debug("Coverage after appending: %.2f%%", appended_coverage * 100)
 
 
 if __name__ == "__main__":
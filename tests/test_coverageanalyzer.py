@@ -1,7 +1,16 @@
+import os
+import sys
+import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
 
-from coverageanalyzer.line import CoveragePyAnalyzer, CoverageReport
+from coverageanalyzer import line as line_module
+from coverageanalyzer.line import (
+    CoveragePyAnalyzer,
+    CoverageReport,
+    LineCoverageReport,
+)
 
 # Set up paths for the dummy project and test harness
 PROJECT_ROOT = Path.cwd() / "resources" / "project"
@@ -10,12 +19,22 @@ HARNESS_PATH = Path.cwd() / "resources" / "harness.py"
 
 class TestCoveragePyAnalyzer(unittest.TestCase):
 
-    def setUp(self):
-        """Set up a fresh CoveragePyAnalyzer instance before each test."""
-        self.analyzer = CoveragePyAnalyzer(
+    @classmethod
+    def setUpClass(cls):
+        """Set up one CoveragePyAnalyzer instance, shared by all tests."""
+        cls.analyzer = CoveragePyAnalyzer(
             project_root=PROJECT_ROOT, harness=HARNESS_PATH
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the coverage data of the shared analyzer."""
+        cls.analyzer.reset()
+
+    def setUp(self):
+        """Start every test from empty coverage data."""
+        self.analyzer.reset()
+
     def test_initial_coverage_run(self):
         """Test that initial coverage analysis runs correctly and returns a CoverageReport."""
         tests = ["sqrt(4)", "cos(0)"]
@@ -51,6 +70,20 @@ class TestCoveragePyAnalyzer(unittest.TestCase):
         self.assertGreaterEqual(updated_coverage, initial_coverage)
         self.assertGreater(updated_coverage, 0)
 
+    def test_append_coverage_batch(self):
+        """Test that batch appending yields the same reports as appending one by one."""
+        tests = ["sqrt(16)", "sin(10)", "cos(1)"]
+        self.analyzer.reset()
+        batch_reports = self.analyzer.append_coverage_batch(tests)
+
+        self.analyzer.reset()
+        single_reports = [self.analyzer.append_coverage(test) for test in tests]
+
+        self.assertEqual(len(batch_reports), len(tests))
+        for batch_report, single_report in zip(batch_reports, single_reports):
+            self.assertEqual(batch_report.coverage_data, single_report.coverage_data)
+        self.analyzer.reset()
+
     def test_reset_clears_coverage(self):
         """Test that reset clears all coverage data."""
         self.analyzer.get_coverage(tests=["sqrt(4)", "sin(0)"])
@@ -90,6 +123,141 @@ class TestCoveragePyAnalyzer(unittest.TestCase):
         self.assertLessEqual(report.get_total_coverage(), 1)
         self.assertTrue(len(report.coverage_data) > 0)
 
+    def test_isolated_coverage_run(self):
+        """Test that running tests in subprocesses yields the same coverage as in-process runs."""
+        tests = ["sqrt(100)", "tan(1)", "cos(2)"]
+        report = self.analyzer.get_coverage(tests=tests)
+
+        isolated_analyzer = CoveragePyAnalyzer(
+            project_root=PROJECT_ROOT, harness=HARNESS_PATH, isolated=True
+        )
+        isolated_report = isolated_analyzer.get_coverage(tests=tests)
+
+        self.assertEqual(isolated_report.coverage_data, report.coverage_data)
+        isolated_analyzer.append_coverage("sin(0)")
+        self.assertGreater(
+            isolated_analyzer.append_coverage("sqrt(-4)").get_total_coverage(),
+            isolated_report.get_total_coverage(),
+        )
+        isolated_analyzer.reset()
+
+    def test_reset_removes_stray_parallel_data(self):
+        """Test that resetting removes parallel data files left by interrupted isolated runs."""
+        stray = Path(f"{self.analyzer.output}.host.1234.XxXxXx")
+        stray.touch()
+        self.analyzer.reset()
+        self.assertFalse(stray.exists())
+
+    def test_get_all_executable_lines(self):
+        """Test that the executable lines of all measured files match the report's."""
+        report = self.analyzer.get_coverage(tests=["sqrt(4)"])
+        executable_lines = CoveragePyAnalyzer.get_all_executable_lines(
+            self.analyzer._cov
+        )
+        self.assertEqual(executable_lines, report.total_executable_lines)
+
+    def test_coverage_of_files_without_executable_lines(self):
+        """Test that files without executable lines count as uncovered instead of failing."""
+        report = LineCoverageReport(
+            {"empty.py": frozenset()}, {"empty.py": frozenset()}
+        )
+        self.assertEqual(report.get_file_coverage("empty.py"), 0.0)
+        self.assertEqual(report.get_total_coverage(), 0.0)
+
+    def test_coverage_uses_project_configuration(self):
+        """Test that both run modes honour the project's own coverage configuration."""
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp)
+            (project / ".coveragerc").write_text("[run]\nomit = */omitted.py\n")
+            (project / "mod.py").write_text("VALUE = 1\n")
+            (project / "omitted.py").write_text("VALUE = 2\n")
+            (project / "harness.py").write_text("import mod, omitted\n")
+            for isolated in (False, True):
+                with self.subTest(isolated=isolated):
+                    analyzer = CoveragePyAnalyzer(
+                        project_root=project, isolated=isolated
+                    )
+                    try:
+                        report = analyzer.get_coverage(tests=["test"])
+                        self.assertEqual(
+                            sorted(Path(file).name for file in report.coverage_data),
+                            ["harness.py", "mod.py"],
+                        )
+                    finally:
+                        analyzer.reset()
+                        sys.modules.pop("omitted", None)
+
+    def test_inproc_run_keeps_modules_outside_project(self):
+        """Test that only project modules are evicted after an in-process test."""
+        with tempfile.TemporaryDirectory() as tmp:
+            # A sibling directory whose name starts with the project's name
+            project, helpers = Path(tmp) / "proj", Path(tmp) / "proj_helpers"
+            project.mkdir()
+            helpers.mkdir()
+            (project / "module.py").write_text("VALUE = 1\n")
+            (helpers / "coverageanalyzer_helper.py").write_text("VALUE = 2\n")
+            (project / "harness.py").write_text(
+                "import sys\n"
+                f"sys.path.append({str(helpers)!r})\n"
+                "import coverageanalyzer_helper, module\n"
+            )
+            analyzer = CoveragePyAnalyzer(project_root=project)
+            try:
+                analyzer.get_coverage(tests=["test"])
+                self.assertNotIn("module", sys.modules)
+                self.assertIn("coverageanalyzer_helper", sys.modules)
+            finally:
+                sys.modules.pop("coverageanalyzer_helper", None)
+                analyzer.reset()
+
+    def test_executable_lines_follow_file_changes(self):
+        """Test that a changed file's executable lines replace its cached ones."""
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp)
+            module = project / "module.py"
+            module.write_text("A = 1\n")
+            (project / "harness.py").write_text("import module\n")
+            analyzer = CoveragePyAnalyzer(project_root=project)
+            try:
+                analyzer.get_coverage(tests=["test"])
+                module.write_text("A = 1\nB = 2\n")
+                report = analyzer.get_coverage(tests=["test"], clean=True)
+                file = str(module.resolve())
+                self.assertEqual(report.total_executable_lines[file], {1, 2})
+                self.assertEqual(len(analyzer._executable_lines), 2)
+            finally:
+                analyzer.reset()
+
+    def test_inproc_run_evicts_installed_project_modules(self):
+        """Test that a project below a library directory is measured afresh by every test."""
+        with tempfile.TemporaryDirectory() as tmp:
+            project, venv = Path(tmp) / "proj", Path(tmp) / "proj" / ".venv"
+            venv.mkdir(parents=True)
+            (project / "mod.py").write_text("def f():\n    return 1\nf()\n")
+            (venv / "coverageanalyzer_lib.py").write_text("VALUE = 1\n")
+            (project / "harness.py").write_text(
+                "import sys\n"
+                f"sys.path.append({str(venv)!r})\n"
+                "import coverageanalyzer_lib, mod\n"
+            )
+            # The project itself is installed, and has a library directory too
+            prefixes = (os.path.join(tmp, ""), os.path.join(venv, ""))
+            analyzer = CoveragePyAnalyzer(project_root=project)
+            try:
+                with mock.patch.object(line_module, "_LIBRARY_PREFIXES", prefixes):
+                    reports = [
+                        analyzer.get_coverage(tests=["test"], clean=True)
+                        for _ in range(2)
+                    ]
+                    self.assertNotIn("mod", sys.modules)
+                    self.assertIn("coverageanalyzer_lib", sys.modules)
+                file = str((project / "mod.py").resolve())
+                self.assertEqual(reports[0].coverage_data[file], {1, 2, 3})
+                self.assertEqual(reports[1].coverage_data[file], {1, 2, 3})
+            finally:
+                sys.modules.pop("coverageanalyzer_lib", None)
+                analyzer.reset()
+
     def test_context_manager_resets_coverage(self):
         """Test that CoveragePyAnalyzer as a context manager resets coverage data on enter and exit."""
 